@@ -0,0 +1,294 @@
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Differential harness: every execution mode must give the same per-claim
+# variance/status and the same summary totals as the eager engine, down to
+# the cent. Each mode runs in a fresh process so peak memory is its own.
+#
+# The eager engine shares build_reconciliation with the other modes, so on
+# its own that would only prove they agree with each other. Every mode is
+# also checked against golden/: the output of the original (pre-streaming)
+# process_reconciliation and generate_statistics for one fixed dataset.
+
+
+MODES = ['eager', 'lazy', 'streaming']
+
+GOLDEN_DIR = Path(__file__).parent / 'golden'
+GOLDEN_SEED = 1
+GOLDEN_PATIENTS = 200
+GOLDEN_COLUMNS = ['claim_id', 'total_transaction_value', 'variance', 'reconciliation_status']
+
+
+def run_mode(mode, claims_path, invoices_path, threads, streaming_chunk_size):
+
+    from concurrency import configure_polars_threads
+    configure_polars_threads(threads)
+
+    from reconciliation_engine import ReconciliationEngine
+
+    engine = ReconciliationEngine(
+        claims_path=claims_path,
+        invoices_path=invoices_path,
+        threads=threads,
+        streaming_chunk_size=streaming_chunk_size if mode == 'streaming' else None
+    )
+
+    timings = {}
+
+    # lazy and streaming scan the CSVs inside the query, so their load is 0
+    start = time.perf_counter()
+    if mode == 'eager':
+        engine.load_data()
+    timings['load'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if mode == 'lazy':
+        engine.reconciliation_df = engine.reconciliation_query().collect()
+    else:
+        engine.process_reconciliation()
+    timings['reconcile'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    stats = engine.generate_statistics()
+    timings['statistics'] = time.perf_counter() - start
+
+    peak_rss_mb = peak_rss()
+
+    return {
+        'reconciliation_df': engine.reconciliation_df,
+        'stats': stats,
+        'timings': timings,
+        'peak_rss_mb': peak_rss_mb
+    }
+
+
+def peak_rss():
+
+    # VmHWM belongs to this process's address space; ru_maxrss would also
+    # count the parent's peak, because Linux keeps it across fork and exec
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    # kilobytes on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def run_isolated(mode, *args):
+
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(run_mode, mode, *args).result()
+
+
+def cents(value):
+
+    return round((value or 0) * 100)
+
+
+def compare_claims(expected_df, actual_df):
+
+    import polars as pl
+
+    columns = ['claim_id', 'total_transaction_value', 'variance', 'reconciliation_status']
+    joined = expected_df.select(columns).join(
+        actual_df.select(columns), on='claim_id', how='full', suffix='_actual'
+    )
+
+    mismatches = joined.filter(
+        pl.col('claim_id').is_null()
+        | pl.col('claim_id_actual').is_null()
+        | (pl.col('reconciliation_status') != pl.col('reconciliation_status_actual'))
+        | ((pl.col('variance') * 100).round(0) != (pl.col('variance_actual') * 100).round(0))
+        | ((pl.col('total_transaction_value') * 100).round(0)
+           != (pl.col('total_transaction_value_actual') * 100).round(0))
+    )
+
+    return [f"claim {row['claim_id'] or row['claim_id_actual']}: {row}"
+            for row in mismatches.head(10).to_dicts()] + (
+        [f"... {len(mismatches) - 10} more claims differ"] if len(mismatches) > 10 else []
+    )
+
+
+def compare_stats(expected, actual):
+
+    errors = []
+
+    for key in ['total_claims', 'balanced', 'overpaid', 'underpaid', 'claim_status_counts']:
+        if expected[key] != actual[key]:
+            errors.append(f"{key}: expected {expected[key]}, got {actual[key]}")
+
+    for key in ['total_overpaid_amount', 'total_underpaid_amount']:
+        if cents(expected[key]) != cents(actual[key]):
+            errors.append(f"{key}: expected {expected[key]:.2f}, got {actual[key]:.2f}")
+
+    for key, name_col, money_cols in [
+        ('top_providers', 'provider_name', ['total_variance']),
+        ('insurance_stats', 'insurance_company', ['total_variance', 'avg_variance'])
+    ]:
+        expected_rows = {row[name_col]: row for row in expected[key]}
+        actual_rows = {row[name_col]: row for row in actual[key]}
+        if expected_rows.keys() != actual_rows.keys():
+            errors.append(f"{key}: expected {sorted(expected_rows)}, got {sorted(actual_rows)}")
+            continue
+        for name, row in expected_rows.items():
+            other = actual_rows[name]
+            if row['count'] != other['count']:
+                errors.append(f"{key}[{name}].count: expected {row['count']}, got {other['count']}")
+            for col in money_cols:
+                if cents(row[col]) != cents(other[col]):
+                    errors.append(f"{key}[{name}].{col}: expected {row[col]:.2f}, got {other[col]:.2f}")
+
+    return errors
+
+
+def write_dataset(tmp_dir, num_patients, seed):
+
+    import generate_data
+
+    _, claims_df, invoices_df = generate_data.generate_all(num_patients, seed)
+    claims_path = tmp_dir / 'claims.csv'
+    invoices_path = tmp_dir / 'invoices.csv'
+    claims_df.write_csv(claims_path)
+    invoices_df.write_csv(invoices_path)
+
+    return claims_path, invoices_path, len(claims_df), len(invoices_df)
+
+
+def load_golden():
+
+    import json
+    import polars as pl
+
+    claims = pl.read_csv(GOLDEN_DIR / f"seed{GOLDEN_SEED}_claims.csv")
+    stats = json.loads((GOLDEN_DIR / f"seed{GOLDEN_SEED}_stats.json").read_text())
+    return claims, stats
+
+
+def write_golden(result):
+
+    import json
+
+    GOLDEN_DIR.mkdir(exist_ok=True)
+    result['reconciliation_df'].select(GOLDEN_COLUMNS).sort('claim_id').write_csv(
+        GOLDEN_DIR / f"seed{GOLDEN_SEED}_claims.csv", float_precision=2
+    )
+    (GOLDEN_DIR / f"seed{GOLDEN_SEED}_stats.json").write_text(
+        json.dumps(result['stats'], indent=2) + '\n'
+    )
+
+
+def check_golden(modes, threads, streaming_chunk_size):
+
+    golden_claims, golden_stats = load_golden()
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        claims_path, invoices_path, _, _ = write_dataset(
+            Path(tmp_dir), GOLDEN_PATIENTS, GOLDEN_SEED
+        )
+        print(f"golden (seed {GOLDEN_SEED}, {GOLDEN_PATIENTS} patients):")
+        for mode in modes:
+            result = run_isolated(mode, claims_path, invoices_path, threads, streaming_chunk_size)
+            errors = (compare_claims(golden_claims, result['reconciliation_df'])
+                      + compare_stats(golden_stats, result['stats']))
+            print(f"  {mode:<10} {'OK' if not errors else 'MISMATCH'}")
+            for error in errors:
+                print(f"    {error}")
+            failures += bool(errors)
+
+    return failures
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description='Check every engine mode against the eager engine and compare their speed'
+    )
+    parser.add_argument('--seeds', type=int, nargs='+', default=[1, 2, 3],
+                        help='datasets to generate, one per seed (default: 1 2 3)')
+    parser.add_argument('--patients', type=int, default=200,
+                        help='patients per dataset (default: 200)')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES,
+                        help='modes to run; eager is always the reference')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='polars thread pool size (default: all cores)')
+    parser.add_argument('--streaming-chunk-size', type=int, default=50000,
+                        help='rows per chunk for the streaming mode (default: 50000)')
+    parser.add_argument('--write-golden', action='store_true',
+                        help='rewrite golden/ from the eager engine; only for an intended change '
+                             'in the expected output')
+    args = parser.parse_args(argv)
+
+    modes = ['eager'] + [mode for mode in args.modes if mode != 'eager']
+
+    if args.write_golden:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            claims_path, invoices_path, _, _ = write_dataset(
+                Path(tmp_dir), GOLDEN_PATIENTS, GOLDEN_SEED
+            )
+            write_golden(run_isolated('eager', claims_path, invoices_path, args.threads, None))
+        print(f"Wrote {GOLDEN_DIR}")
+        return 0
+
+    failures = check_golden(modes, args.threads, args.streaming_chunk_size)
+
+    for seed in args.seeds:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            claims_path, invoices_path, num_claims, num_invoices = write_dataset(
+                Path(tmp_dir), args.patients, seed
+            )
+
+            print(f"\nseed {seed}: {num_claims:,} claims, {num_invoices:,} invoices")
+            print(f"  {'mode':<10} {'load s':>8} {'reconcile s':>12} {'stats s':>8} "
+                  f"{'invoices/s':>12} {'peak RSS MB':>12}  result")
+
+            reference = None
+            for mode in modes:
+                result = run_isolated(
+                    mode, claims_path, invoices_path, args.threads, args.streaming_chunk_size
+                )
+                if reference is None:
+                    reference = result
+                    errors = []
+                else:
+                    errors = (compare_claims(reference['reconciliation_df'], result['reconciliation_df'])
+                              + compare_stats(reference['stats'], result['stats']))
+
+                timings = result['timings']
+                # throughput covers reading and reconciling, since lazy and
+                # streaming do both inside the reconcile step
+                elapsed = timings['load'] + timings['reconcile']
+                rate = num_invoices / elapsed if elapsed else 0
+                rss = f"{result['peak_rss_mb']:.1f}" if result['peak_rss_mb'] is not None else 'n/a'
+                status = 'reference' if result is reference else ('OK' if not errors else 'MISMATCH')
+                print(f"  {mode:<10} {timings['load']:>8.3f} {timings['reconcile']:>12.3f} "
+                      f"{timings['statistics']:>8.3f} {rate:>12,.0f} {rss:>12}  {status}")
+                for error in errors:
+                    print(f"    {error}")
+                failures += bool(errors)
+
+    if failures:
+        print(f"\n{failures} mode run(s) did not match the golden output or the eager engine")
+        return 1
+    print("\nAll modes match the golden output and the eager engine to the cent")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
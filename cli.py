@@ -0,0 +1,338 @@
+
+import argparse
+import math
+import sys
+from pathlib import Path
+
+from concurrency import configure_polars_threads
+
+# polars and faker are imported inside the command handlers, not here, so
+# `--help` and `lookup` don't pay for them
+
+
+DEFAULT_DATA_DIR = 'data'
+DEFAULT_CLAIMS_PATH = 'data/claims.csv'
+DEFAULT_INVOICES_PATH = 'data/invoices.csv'
+DEFAULT_REPORT_PATH = 'report.html'
+
+EXPORT_FORMATS = ['csv', 'parquet', 'json', 'html']
+
+
+def confidence_level(value):
+
+    value = float(value)
+    if not 0 < value < 1:
+        raise argparse.ArgumentTypeError(f"must be between 0 and 1 (exclusive), got {value}")
+    return value
+
+
+def sample_fraction(value):
+
+    value = float(value)
+    if not 0 < value <= 1:
+        raise argparse.ArgumentTypeError(f"must be greater than 0 and at most 1, got {value}")
+    return value
+
+
+def json_safe(value):
+
+    # unbounded interval ends are +/-inf, which JSON can't represent: emit null
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(item) for item in value]
+    return value
+
+
+def build_engine(args, process=True):
+
+    configure_polars_threads(args.threads)
+    from reconciliation_engine import ReconciliationEngine
+
+    engine = ReconciliationEngine(
+        claims_path=args.claims,
+        invoices_path=args.invoices,
+        threads=args.threads,
+        streaming_chunk_size=args.streaming_chunk_size
+    )
+    if process:
+        engine.load_data()
+        engine.process_reconciliation()
+
+    return engine
+
+
+def cmd_generate(args):
+
+    configure_polars_threads(args.threads)
+    import generate_data
+
+    generate_data.main(
+        output_dir=args.output_dir,
+        num_patients=args.patients,
+        seed=args.seed
+    )
+    return 0
+
+
+def cmd_reconcile(args):
+
+    engine = build_engine(args)
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+
+    for fmt in args.format:
+        output_path = f"{args.output}.{fmt}"
+        engine.export(output_path, fmt)
+        print(f"Wrote {output_path}")
+    return 0
+
+
+def print_stats(stats):
+
+    intervals = stats.get('confidence_intervals', {})
+
+    def ci(key, fmt):
+        if key not in intervals:
+            return ''
+        low, high = intervals[key]
+        return f"  [{low:{fmt}} .. {high:{fmt}}]"
+
+    print(f"Total claims: {stats['total_claims']:,}")
+    print(f"Balanced:     {stats['balanced']:,} ({stats['balanced_pct']:.1f}%){ci('balanced_pct', '.1f')}")
+    print(f"Overpaid:     {stats['overpaid']:,} ({stats['overpaid_pct']:.1f}%){ci('overpaid_pct', '.1f')}")
+    print(f"Underpaid:    {stats['underpaid']:,} ({stats['underpaid_pct']:.1f}%){ci('underpaid_pct', '.1f')}")
+    print(f"Total overpaid amount:  ${stats['total_overpaid_amount']:,.2f}"
+          f"{ci('total_overpaid_amount', ',.2f')}")
+    print(f"Total underpaid amount: ${stats['total_underpaid_amount']:,.2f}"
+          f"{ci('total_underpaid_amount', ',.2f')}")
+    print("Top providers by total variance:")
+    if 'top_providers_note' in stats:
+        print(f"  ({stats['top_providers_note']})")
+    for provider in stats['top_providers']:
+        line = f"  {provider['provider_name']}: ${provider['total_variance']:,.2f}"
+        if 'total_variance_ci' in provider:
+            low, high = provider['total_variance_ci']
+            line += f" [{low:,.2f} .. {high:,.2f}]"
+        print(f"{line} ({provider['count']} claims)")
+    if stats.get('unknown_strata'):
+        print(f"Too few sampled claims to bound: {', '.join(stats['unknown_strata'])}")
+
+
+def cmd_stats(args):
+
+    import json
+
+    if not args.approximate:
+        engine = build_engine(args)
+        stats = engine.generate_statistics()
+        if args.json:
+            print(json.dumps(json_safe(stats), indent=2, default=str, allow_nan=False))
+        else:
+            print_stats(stats)
+        return 0
+
+    # print an early estimate, then refine it as more claims are scanned
+    engine = build_engine(args, process=False)
+    estimates = engine.iter_approximate_statistics(
+        sample_fraction=args.sample_fraction,
+        confidence=args.confidence,
+        seed=args.seed
+    )
+    for stats in estimates:
+        if args.json:
+            print(json.dumps(json_safe(stats), default=str, allow_nan=False), flush=True)
+        else:
+            print(f"\n--- {stats['sampled_claims']:,} claims sampled "
+                  f"({stats['sample_fraction'] * 100:.1f}%), "
+                  f"{stats['confidence'] * 100:.0f}% confidence intervals ---")
+            print_stats(stats)
+            sys.stdout.flush()
+    return 0
+
+
+def cmd_report(args):
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+
+    if args.profile_dir is not None:
+        engine = build_engine(args, process=False)
+        engine.run(args.output, profile_dir=args.profile_dir)
+        print(f"Wrote {args.output}")
+        print(f"Profile written to {engine.profile_run_dir}")
+        print((engine.profile_run_dir / 'summary.txt').read_text(), end='')
+        return 0
+
+    engine = build_engine(args)
+    engine.generate_html_report(args.output)
+    print(f"Wrote {args.output}")
+    return 0
+
+
+def cmd_batch(args):
+
+    # before the scheduler's jobs import reconciliation_engine, and with it polars
+    configure_polars_threads(args.threads)
+    from concurrency import ReconciliationScheduler
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    jobs = []
+    for data_dir in args.data_dirs:
+        data_dir = Path(data_dir)
+        jobs.append((
+            data_dir / 'claims.csv',
+            data_dir / 'invoices.csv',
+            output_dir / f"{data_dir.name}.html"
+        ))
+
+    scheduler = ReconciliationScheduler(
+        threads=args.threads,
+        streaming_chunk_size=args.streaming_chunk_size,
+        report_workers=args.report_workers
+    )
+    scheduler.run(jobs)
+
+    for _, _, output_path in jobs:
+        print(f"Wrote {output_path}")
+    return 0
+
+
+def cmd_lookup(args):
+
+    # a single claim doesn't need polars, a csv scan is much faster to start
+    import csv
+    from decimal import Decimal
+
+    claim = None
+    with open(args.claims, newline='') as f:
+        for row in csv.DictReader(f):
+            if row['claim_id'] == args.claim_id:
+                claim = row
+                break
+
+    if claim is None:
+        print(f"Claim {args.claim_id} not found in {args.claims}", file=sys.stderr)
+        return 1
+
+    invoices = []
+    with open(args.invoices, newline='') as f:
+        for row in csv.DictReader(f):
+            if row['claim_id'] == args.claim_id:
+                invoices.append(row)
+
+    # same rule as build_reconciliation: the total and the benefit are each
+    # rounded to whole cents (half to even) and compared there
+    cent = Decimal('0.01')
+    benefit_amount = Decimal(claim['benefit_amount']).quantize(cent)
+    total_transaction_value = sum(
+        (Decimal(inv['transaction_value']) for inv in invoices), Decimal(0)
+    ).quantize(cent)
+    variance = total_transaction_value - benefit_amount
+
+    if total_transaction_value == benefit_amount:
+        status = 'BALANCED'
+    elif total_transaction_value > benefit_amount:
+        status = 'OVERPAID'
+    else:
+        status = 'UNDERPAID'
+
+    for key, value in claim.items():
+        print(f"{key}: {value}")
+    print(f"total_transaction_value: {total_transaction_value:.2f}")
+    print(f"reconciliation_status: {status} (compared to the cent)")
+    print(f"variance: {variance:.2f}")
+    print(f"invoices ({len(invoices)}):")
+    for inv in invoices:
+        print(f"  {inv['invoice_id']}  {inv['invoice_date']}  {inv['type_of_bill']:<17} "
+              f"{float(inv['transaction_value']):>10.2f}  {inv['payment_status']}")
+    return 0
+
+
+def add_input_args(parser):
+
+    parser.add_argument('--claims', default=DEFAULT_CLAIMS_PATH,
+                        help=f"claims CSV (default: {DEFAULT_CLAIMS_PATH})")
+    parser.add_argument('--invoices', default=DEFAULT_INVOICES_PATH,
+                        help=f"invoices CSV (default: {DEFAULT_INVOICES_PATH})")
+
+
+def build_parser():
+
+    parser = argparse.ArgumentParser(
+        prog='cli.py',
+        description='Insurance claims reconciliation engine'
+    )
+    parser.add_argument('--threads', type=int, default=None,
+                        help='polars thread pool size (default: all cores)')
+    parser.add_argument('--streaming-chunk-size', type=int, default=None,
+                        help='run reconciliation on the polars streaming engine '
+                             'with this many rows per chunk')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate = subparsers.add_parser('generate', help='generate synthetic CSV data')
+    generate.add_argument('--output-dir', default=DEFAULT_DATA_DIR,
+                          help=f"directory for the CSV files (default: {DEFAULT_DATA_DIR})")
+    generate.add_argument('--patients', type=int, default=200,
+                          help='number of patients (default: 200)')
+    generate.add_argument('--seed', type=int, default=None,
+                          help='random seed for reproducible data')
+    generate.set_defaults(func=cmd_generate)
+
+    reconcile = subparsers.add_parser('reconcile', help='write the reconciliation table')
+    add_input_args(reconcile)
+    reconcile.add_argument('--output', default='reconciliation',
+                           help='output path without extension (default: reconciliation)')
+    reconcile.add_argument('--format', nargs='+', choices=EXPORT_FORMATS, default=['csv'],
+                           help='one or more output formats (default: csv)')
+    reconcile.set_defaults(func=cmd_reconcile)
+
+    stats = subparsers.add_parser('stats', help='print the executive summary')
+    add_input_args(stats)
+    stats.add_argument('--json', action='store_true',
+                       help='print statistics as JSON (one object per estimate with --approximate)')
+    stats.add_argument('--approximate', action='store_true',
+                       help='estimate from a growing sample of claims, printing each refinement')
+    stats.add_argument('--sample-fraction', type=sample_fraction, default=0.05,
+                       help='fraction of claims to scan before stopping (default: 0.05)')
+    stats.add_argument('--confidence', type=confidence_level, default=0.95,
+                       help='confidence level of the intervals (default: 0.95)')
+    stats.add_argument('--seed', type=int, default=0,
+                       help='hash seed that picks the sampled claims (default: 0)')
+    stats.set_defaults(func=cmd_stats)
+
+    report = subparsers.add_parser('report', help='generate the HTML report')
+    add_input_args(report)
+    report.add_argument('--output', default=DEFAULT_REPORT_PATH,
+                        help=f"HTML report path (default: {DEFAULT_REPORT_PATH})")
+    report.add_argument('--profile-dir', default=None,
+                        help='save query plans, timings and a rendering profile '
+                             'to a timestamped directory under this one')
+    report.set_defaults(func=cmd_report)
+
+    batch = subparsers.add_parser('batch', help='generate HTML reports for several data directories')
+    batch.add_argument('data_dirs', nargs='+',
+                       help='directories containing claims.csv and invoices.csv')
+    batch.add_argument('--output-dir', default='reports',
+                       help='directory for the HTML reports (default: reports)')
+    batch.add_argument('--report-workers', type=int, default=1,
+                       help='reports rendered/written concurrently (default: 1)')
+    batch.set_defaults(func=cmd_batch)
+
+    lookup = subparsers.add_parser('lookup', help='show one claim and its invoices')
+    add_input_args(lookup)
+    lookup.add_argument('claim_id', help='claim to look up, e.g. C000001')
+    lookup.set_defaults(func=cmd_lookup)
+
+    return parser
+
+
+def main(argv=None):
+
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+
+import os
+from collections import deque
+
+# no polars or concurrent.futures import here: cli.py imports this module at
+# startup, and configure_polars_threads has to run before polars is loaded
+
+
+def configure_polars_threads(threads):
+
+    # polars reads this once, when it's first imported
+    if threads:
+        os.environ['POLARS_MAX_THREADS'] = str(threads)
+
+
+class ReconciliationScheduler:
+
+    # Runs a batch of (claims_path, invoices_path, output_path) jobs.
+    # While one job is being reconciled, the next job's CSVs are read on a
+    # background thread and previous reports are rendered/written by up to
+    # report_workers threads, so I/O overlaps with compute. In streaming mode
+    # the CSVs are only read while the streaming query runs, so the background
+    # thread runs the next job's whole reconciliation instead.
+
+    def __init__(self, threads=None, streaming_chunk_size=None, report_workers=1, prefetch=1):
+
+        if report_workers < 1:
+            raise ValueError("report_workers must be at least 1")
+        if prefetch < 0:
+            raise ValueError("prefetch must not be negative")
+
+        self.threads = threads
+        self.streaming_chunk_size = streaming_chunk_size
+        self.report_workers = report_workers
+        self.prefetch = prefetch
+
+    def _load(self, claims_path, invoices_path):
+
+        from reconciliation_engine import ReconciliationEngine
+
+        engine = ReconciliationEngine(
+            claims_path=claims_path,
+            invoices_path=invoices_path,
+            threads=self.threads,
+            streaming_chunk_size=self.streaming_chunk_size
+        )
+        engine.load_data()
+        if self.streaming_chunk_size is not None:
+            engine.process_reconciliation()
+        return engine
+
+    def run(self, jobs):
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        jobs = list(jobs)
+        results = [None] * len(jobs)
+
+        with ThreadPoolExecutor(max_workers=max(self.prefetch, 1)) as reader, \
+                ThreadPoolExecutor(max_workers=self.report_workers) as writer:
+
+            loads = deque()
+            next_job = 0
+            reports = deque()
+
+            for i, (claims_path, invoices_path, output_path) in enumerate(jobs):
+
+                # keep up to `prefetch` jobs loading ahead of the current one
+                while next_job < len(jobs) and next_job <= i + self.prefetch:
+                    loads.append(reader.submit(self._load, *jobs[next_job][:2]))
+                    next_job += 1
+
+                engine = loads.popleft().result()
+                if engine.reconciliation_df is None:
+                    engine.process_reconciliation()
+
+                # don't let finished-but-unwritten reports pile up in memory
+                while len(reports) >= self.report_workers:
+                    index, future = reports.popleft()
+                    results[index] = future.result()
+
+                reports.append((i, writer.submit(engine.generate_html_report, output_path)))
+
+            for index, future in reports:
+                results[index] = future.result()
+
+        return results
@@ -2,10 +2,22 @@
 import polars as pl
 import random
 from datetime import datetime, timedelta
-from faker import Faker
+from pathlib import Path
 
 
-fake = Faker()
+# Faker is slow to import and construct, so it's only built on first use
+_fake = None
+
+
+def get_faker(seed=None):
+
+    global _fake
+    if _fake is None:
+        from faker import Faker
+        _fake = Faker()
+    if seed is not None:
+        _fake.seed_instance(seed)
+    return _fake
 
 
 NUM_PATIENTS = 200
@@ -17,6 +29,7 @@ MAX_INVOICES_PER_CLAIM = 5
 def generate_patients(num_patients):
 
     patients = []
+    fake = get_faker()
 
     
     us_states = [
@@ -136,21 +149,33 @@ def generate_invoices(claims_df):
     
     return pl.DataFrame(invoices)
 
-def main():
+def generate_all(num_patients=NUM_PATIENTS, seed=None):
+
+    if seed is not None:
+        random.seed(seed)
+        get_faker(seed)
 
-    patients_df = generate_patients(NUM_PATIENTS)
+    patients_df = generate_patients(num_patients)
     claims_df = generate_claims(patients_df)
     invoices_df = generate_invoices(claims_df)
 
+    return patients_df, claims_df, invoices_df
+
+def main(output_dir='data', num_patients=NUM_PATIENTS, seed=None):
+
+    patients_df, claims_df, invoices_df = generate_all(num_patients, seed)
+
     # Save to CSV
-    patients_df.write_csv('data/patients.csv')
-    claims_df.write_csv('data/claims.csv')
-    invoices_df.write_csv('data/invoices.csv')
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    patients_df.write_csv(output_dir / 'patients.csv')
+    claims_df.write_csv(output_dir / 'claims.csv')
+    invoices_df.write_csv(output_dir / 'invoices.csv')
 
     print(f"Files created:")
-    print(f"data/patients.csv ({len(patients_df)} rows)")
-    print(f"data/claims.csv ({len(claims_df)} rows)")
-    print(f"data/invoices.csv ({len(invoices_df)} rows)")
+    print(f"{output_dir / 'patients.csv'} ({len(patients_df)} rows)")
+    print(f"{output_dir / 'claims.csv'} ({len(claims_df)} rows)")
+    print(f"{output_dir / 'invoices.csv'} ({len(invoices_df)} rows)")
     print(f"Average claims per patient: {len(claims_df)/len(patients_df):.1f}")
     print(f"Average invoices per claim: {len(invoices_df)/len(claims_df):.1f}")
 
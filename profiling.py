@@ -0,0 +1,139 @@
+
+import cProfile
+import io
+import json
+import pstats
+import time
+from datetime import datetime
+from pathlib import Path
+
+import polars as pl
+
+# Opt-in profiling for ReconciliationEngine.run. Everything for one run goes
+# into <profile_dir>/run-<timestamp with microseconds>/:
+#
+#   join_plan.txt / statistics_plans.txt   optimized polars plans
+#   join_profile.csv / statistics_profile.csv   per-node timings (microseconds)
+#   render.prof / render_hotspots.txt      cProfile of the HTML rendering
+#   summary.json / summary.txt             stage times and the slowest node
+
+
+HOTSPOT_LINES = 30
+
+
+def profile_query(name, query):
+
+    # LazyFrame.profile() was removed in polars 2.0; there we can only time
+    # the query as a whole
+    if hasattr(query, 'profile'):
+        result, timings = query.profile()
+    else:
+        start = time.perf_counter()
+        result = query.collect()
+        elapsed = int((time.perf_counter() - start) * 1_000_000)
+        timings = pl.DataFrame({'node': ['<whole query>'], 'start': [0], 'end': [elapsed]})
+
+    timings = timings.select([
+        pl.lit(name).alias('query'),
+        pl.col('node').cast(pl.Utf8),
+        pl.col('start').cast(pl.Int64),
+        pl.col('end').cast(pl.Int64)
+    ]).with_columns((pl.col('end') - pl.col('start')).alias('duration_us'))
+
+    return result, timings
+
+
+def make_run_dir(profile_dir):
+
+    # microseconds keep runs apart; the counter covers clock ties
+    name = datetime.now().strftime('run-%Y%m%d-%H%M%S-%f')
+    Path(profile_dir).mkdir(parents=True, exist_ok=True)
+    counter = 0
+    while True:
+        run_dir = Path(profile_dir) / (f"{name}-{counter}" if counter else name)
+        try:
+            run_dir.mkdir()
+            return run_dir
+        except FileExistsError:
+            counter += 1
+
+
+def profile_run(engine, output_path, profile_dir):
+
+    from reconciliation_engine import statistics_queries
+
+    run_dir = make_run_dir(profile_dir)
+    stages = {}
+
+    start = time.perf_counter()
+    engine.load_data()
+    stages['load'] = time.perf_counter() - start
+
+    # the join runs through profile() so its timings describe the real run
+    join_query = engine.reconciliation_query()
+    (run_dir / 'join_plan.txt').write_text(join_query.explain())
+
+    start = time.perf_counter()
+    engine.reconciliation_df, join_timings = profile_query('join', join_query)
+    stages['reconcile'] = time.perf_counter() - start
+    join_timings.write_csv(run_dir / 'join_profile.csv')
+
+    start = time.perf_counter()
+    stats = engine.generate_statistics()
+    stages['statistics'] = time.perf_counter() - start
+
+    # the statistics queries are run once more, one at a time, for their timings
+    plans = []
+    statistics_timings = []
+    for name, query in statistics_queries(engine.reconciliation_df.lazy()).items():
+        plans.append(f"== {name} ==\n{query.explain()}\n")
+        statistics_timings.append(profile_query(name, query)[1])
+    (run_dir / 'statistics_plans.txt').write_text('\n'.join(plans))
+    statistics_timings = pl.concat(statistics_timings)
+    statistics_timings.write_csv(run_dir / 'statistics_profile.csv')
+
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    # reuse the statistics computed above so render only measures rendering
+    engine.generate_html_report(output_path, stats=stats)
+    profiler.disable()
+    stages['render'] = time.perf_counter() - start
+
+    profiler.dump_stats(run_dir / 'render.prof')
+    hotspots = io.StringIO()
+    pstats.Stats(profiler, stream=hotspots).sort_stats('cumulative').print_stats(HOTSPOT_LINES)
+    (run_dir / 'render_hotspots.txt').write_text(hotspots.getvalue())
+
+    slowest_node = pl.concat([join_timings, statistics_timings]).sort(
+        'duration_us', descending=True
+    ).row(0, named=True)
+    slowest_stage = max(stages, key=stages.get)
+
+    summary = {
+        'claims_path': str(engine.claims_path),
+        'invoices_path': str(engine.invoices_path),
+        'output_path': str(output_path),
+        'polars_version': pl.__version__,
+        'per_node_timings': hasattr(join_query, 'profile'),
+        'stages_seconds': stages,
+        'slowest_stage': slowest_stage,
+        'slowest_node': slowest_node
+    }
+    (run_dir / 'summary.json').write_text(json.dumps(summary, indent=2))
+
+    lines = [f"Profile of {engine.claims_path} + {engine.invoices_path}", ""]
+    total = sum(stages.values())
+    for stage, seconds in stages.items():
+        share = (seconds / total * 100) if total > 0 else 0
+        lines.append(f"{stage:<12} {seconds:>9.3f}s {share:>5.1f}%")
+    lines.append("")
+    lines.append(f"Slowest stage: {slowest_stage}")
+    lines.append(f"Slowest plan node: {slowest_node['node']} in {slowest_node['query']} "
+                 f"({slowest_node['duration_us'] / 1000:.1f} ms)")
+    if not summary['per_node_timings']:
+        lines.append(f"(polars {pl.__version__} has no LazyFrame.profile(), "
+                     f"so plan nodes are whole queries)")
+    (run_dir / 'summary.txt').write_text('\n'.join(lines) + '\n')
+
+    return stats, run_dir
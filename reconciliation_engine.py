@@ -1,69 +1,213 @@
 
+import math
+import warnings
+
 import polars as pl
 from pathlib import Path
 
+from sampling import estimate_statistics, strata_ready, z_score
+
+# claims are split into this many hash buckets for approximate statistics
+SAMPLE_BUCKETS = 1024
+
+
+def build_reconciliation(claims, invoices):
+
+    # works on both DataFrames (eager) and LazyFrames (lazy/streaming)
+    invoice_totals = invoices.group_by('claim_id').agg(
+        pl.col('transaction_value').sum().alias('total_transaction_value')
+    )
+    
+    reconciliation = claims.join(
+        invoice_totals, 
+        on='claim_id', 
+        how='left'
+    )
+    
+
+    # money is compared in whole cents: float sums of cent amounts can miss
+    # an exact balance by a rounding error that depends on summation order
+    total_cents = (pl.col('total_transaction_value').fill_null(0) * 100).round(0).cast(pl.Int64)
+    benefit_cents = (pl.col('benefit_amount') * 100).round(0).cast(pl.Int64)
+
+    reconciliation = reconciliation.with_columns([
+        total_cents.alias('_total_cents'),
+        benefit_cents.alias('_benefit_cents')
+    ])
+
+    reconciliation = reconciliation.with_columns([
+
+        (pl.col('_total_cents') / 100).alias('total_transaction_value'),
+        ((pl.col('_total_cents') - pl.col('_benefit_cents')) / 100).alias('variance'),
+        pl.when(
+            pl.col('_total_cents') == pl.col('_benefit_cents')
+        ).then(pl.lit('BALANCED'))
+        .when(
+            pl.col('_total_cents') > pl.col('_benefit_cents')
+        ).then(pl.lit('OVERPAID'))
+        .otherwise(pl.lit('UNDERPAID'))
+        .alias('reconciliation_status')
+    ]).drop(['_total_cents', '_benefit_cents'])
+
+    return reconciliation
+
+def statistics_queries(reconciliation):
+
+    # reconciliation is a LazyFrame of the reconciled claims
+    return {
+        'status_counts': reconciliation.group_by('reconciliation_status').agg(
+            pl.len().alias('count')
+        ),
+        'total_overpaid': reconciliation.filter(
+            pl.col('reconciliation_status') == 'OVERPAID'
+        ).select(pl.col('variance').sum()),
+        'total_underpaid': reconciliation.filter(
+            pl.col('reconciliation_status') == 'UNDERPAID'
+        ).select(pl.col('variance').sum()),
+        'claim_status_counts': reconciliation.group_by('claim_status').agg(
+            pl.len().alias('count')
+        ),
+        'provider_stats': reconciliation.group_by('provider_name').agg([
+            pl.len().alias('count'),
+            pl.col('variance').sum().alias('total_variance')
+        ]).sort('total_variance', descending=True).head(5),
+        'insurance_stats': reconciliation.group_by('insurance_company').agg([
+            pl.len().alias('count'),
+            pl.col('variance').sum().alias('total_variance'),
+            pl.col('variance').mean().alias('avg_variance')
+        ]).sort('total_variance', descending=True)
+    }
+
 class ReconciliationEngine:
 
     
-    def __init__(self, claims_path, invoices_path):
+    def __init__(self, claims_path, invoices_path, threads=None, streaming_chunk_size=None):
 
         self.claims_path = Path(claims_path)
         self.invoices_path = Path(invoices_path)
+        self.threads = threads
+        self.streaming_chunk_size = streaming_chunk_size
         self.claims_df = None
         self.invoices_df = None
         self.reconciliation_df = None
+        self.profile_run_dir = None
+
+        # polars sizes its thread pool once, on import, so by now it's too late
+        # to change it; call concurrency.configure_polars_threads (or set
+        # POLARS_MAX_THREADS) before polars is imported, as the CLI does
+        if threads and pl.thread_pool_size() != threads:
+            warnings.warn(
+                f"polars thread pool already started with {pl.thread_pool_size()} "
+                f"threads; set POLARS_MAX_THREADS={threads} before importing polars"
+            )
         
     def load_data(self):
   
+        # the streaming engine scans the CSVs itself, chunk by chunk, so
+        # reading them in full here would defeat it
+        if self.streaming_chunk_size is not None:
+            return
+
         # read CSV files
         self.claims_df = pl.read_csv(self.claims_path)
         self.invoices_df = pl.read_csv(self.invoices_path)
      
         
+    def _sources(self):
+
+        # reuse loaded frames, otherwise scan the CSVs without reading them in full
+        if self.claims_df is not None and self.invoices_df is not None:
+            return self.claims_df.lazy(), self.invoices_df.lazy()
+        return pl.scan_csv(self.claims_path), pl.scan_csv(self.invoices_path)
+
+    def reconciliation_query(self):
+
+        return build_reconciliation(*self._sources())
+
     def process_reconciliation(self):
-  
-        
-        invoice_totals = self.invoices_df.group_by('claim_id').agg(
-            pl.col('transaction_value').sum().alias('total_transaction_value')
-        )
-        
-        reconciliation = self.claims_df.join(
-            invoice_totals, 
-            on='claim_id', 
-            how='left'
-        )
+
+        if self.streaming_chunk_size is None:
+            self.reconciliation_df = build_reconciliation(self.claims_df, self.invoices_df)
+            return
+
+        # same query, run through the streaming engine straight from the CSVs
+        with pl.Config(streaming_chunk_size=self.streaming_chunk_size):
+            self.reconciliation_df = self.reconciliation_query().collect(engine='streaming')
         
 
-        reconciliation = reconciliation.with_columns(
-            pl.col('total_transaction_value').fill_null(0)
-        )
+    def iter_approximate_statistics(self, sample_fraction=0.05, confidence=0.95, seed=0):
+
+        # checked up front, before the scan rather than after it
+        if not 0 < sample_fraction <= 1:
+            raise ValueError(f"sample_fraction must be in (0, 1], got {sample_fraction}")
+        z_score(confidence)
 
-        reconciliation = reconciliation.with_columns([
+        claims, invoices = self._sources()
 
-            (pl.col('total_transaction_value') - pl.col('benefit_amount')).alias('variance'),
-            pl.when(
-                pl.col('total_transaction_value') == pl.col('benefit_amount')
-            ).then(pl.lit('BALANCED'))
-            .when(
-                pl.col('total_transaction_value') > pl.col('benefit_amount')
-            ).then(pl.lit('OVERPAID'))
-            .otherwise(pl.lit('UNDERPAID'))
-            .alias('reconciliation_status')
+        # every claim lands in one bucket, together with all of its invoices
+        bucket = (pl.col('claim_id').hash(seed) % SAMPLE_BUCKETS).alias('bucket')
+        target = max(1, min(SAMPLE_BUCKETS, math.ceil(sample_fraction * SAMPLE_BUCKETS)))
+
+        # one pass over each file: the population counts and the sampled rows
+        # share the claims scan, and only the columns the estimates need are read.
+        # Both files are still parsed in full before the first estimate, since a
+        # claim's invoices can be anywhere in the file; sampling saves memory and
+        # reconciliation work, not I/O
+        claims = claims.select([
+            'claim_id', 'benefit_amount', 'claim_status', 'provider_name', 'insurance_company'
+        ]).with_columns(bucket)
+        invoices = invoices.select(['claim_id', 'transaction_value']).with_columns(bucket)
+        counts = [claims.group_by(col).agg(pl.len().alias('population'))
+                  for col in ['insurance_company', 'provider_name', 'claim_status']]
+        *counts, sampled_claims, sampled_invoices = pl.collect_all(counts + [
+            claims.filter(pl.col('bucket') < target),
+            invoices.filter(pl.col('bucket') < target)
         ])
-        
-        self.reconciliation_df = reconciliation
-        
+        population = {
+            'total_claims': counts[2]['population'].sum(),
+            'insurance_company': counts[0],
+            'provider_name': counts[1],
+            'claim_status': counts[2]
+        }
+
+        # each round reconciles only the buckets it adds, twice as many as the
+        # round before; estimates are held back until every insurer stratum
+        # has a variance estimate, except for the final one
+        scanned = 0
+        step = 1
+        parts = []
+
+        while scanned < target:
+            upto = min(target, scanned + step)
+            in_round = pl.col('bucket').is_between(scanned, upto, closed='left')
+            parts.append(build_reconciliation(
+                sampled_claims.filter(in_round), sampled_invoices.filter(in_round)
+            ))
+            scanned = upto
+            step *= 2
+
+            sample = pl.concat(parts)
+            if scanned == target or strata_ready(
+                sample, population['insurance_company'], 'insurance_company'
+            ):
+                yield estimate_statistics(sample, population, confidence)
+
+    def generate_statistics(self, approximate=False, sample_fraction=0.05, confidence=0.95, seed=0):
+
+        if approximate:
+            stats = None
+            for stats in self.iter_approximate_statistics(sample_fraction, confidence, seed):
+                pass
+            return stats
 
-    def generate_statistics(self):
         total_claims = len(self.reconciliation_df)
         
-        status_counts = self.reconciliation_df.group_by('reconciliation_status').agg(
-            pl.len().alias('count')
-        )
-        
+        # one lazy query per figure, run together so polars can share the scans
+        queries = statistics_queries(self.reconciliation_df.lazy())
+        results = dict(zip(queries, pl.collect_all(list(queries.values()))))
 
         status_dict = {row['reconciliation_status']: row['count'] 
-                      for row in status_counts.to_dicts()}
+                      for row in results['status_counts'].to_dicts()}
         
         balanced = status_dict.get('BALANCED', 0)
         overpaid = status_dict.get('OVERPAID', 0)
@@ -75,35 +219,19 @@ class ReconciliationEngine:
         overpaid_pct = (overpaid / total_claims * 100) if total_claims > 0 else 0
         underpaid_pct = (underpaid / total_claims * 100) if total_claims > 0 else 0
         
-        total_overpaid = self.reconciliation_df.filter(
-            pl.col('reconciliation_status') == 'OVERPAID'
-        ).select(pl.col('variance').sum()).item()
+        total_overpaid = results['total_overpaid'].item()
         
         if total_overpaid is None:
             total_overpaid = 0
         
-        total_underpaid = abs(self.reconciliation_df.filter(
-            pl.col('reconciliation_status') == 'UNDERPAID'
-        ).select(pl.col('variance').sum()).item() or 0)
+        total_underpaid = abs(results['total_underpaid'].item() or 0)
         
  
-        claim_status_counts = self.reconciliation_df.group_by('claim_status').agg(
-            pl.len().alias('count')
-        )
         claim_status_dict = {row['claim_status']: row['count'] 
-                            for row in claim_status_counts.to_dicts()}
+                            for row in results['claim_status_counts'].to_dicts()}
 
-        provider_stats = self.reconciliation_df.group_by('provider_name').agg([
-            pl.len().alias('count'),
-            pl.col('variance').sum().alias('total_variance')
-        ]).sort('total_variance', descending=True).head(5)
-        
- 
-        insurance_stats = self.reconciliation_df.group_by('insurance_company').agg([
-            pl.len().alias('count'),
-            pl.col('variance').sum().alias('total_variance'),
-            pl.col('variance').mean().alias('avg_variance')
-        ]).sort('total_variance', descending=True)
+        provider_stats = results['provider_stats']
+        insurance_stats = results['insurance_stats']
         
         return {
             'total_claims': total_claims,
@@ -120,23 +248,26 @@ class ReconciliationEngine:
             'insurance_stats': insurance_stats.to_dicts()
         }
     
-    def generate_html_report(self, output_path='report.html'):
+    def generate_html_report(self, output_path='report.html', stats=None):
 
-        stats = self.generate_statistics()
+        if stats is None:
+            stats = self.generate_statistics()
         
         rows = self.reconciliation_df.to_dicts()
         
-        table_rows = ""
+        # collected in a list and joined once; repeated += on one big string
+        # is quadratic whenever CPython can't resize it in place (e.g. under cProfile)
+        table_rows = []
         for row in rows:
-            table_rows += "<tr>"
-            table_rows += f"<td>{row['claim_id']}</td>"
-            table_rows += f"<td>{row['patient_id']}</td>"
-            table_rows += f"<td>{row['date_of_service']}</td>"
-            table_rows += f"<td>{row['provider_name']}</td>"
-            table_rows += f"<td>{row['insurance_company']}</td>"
-            table_rows += f"<td>${row['charges_amount']:,.2f}</td>"
-            table_rows += f"<td>${row['benefit_amount']:,.2f}</td>"
-            table_rows += f"<td>${row['total_transaction_value']:,.2f}</td>"
+            table_rows.append("<tr>")
+            table_rows.append(f"<td>{row['claim_id']}</td>")
+            table_rows.append(f"<td>{row['patient_id']}</td>")
+            table_rows.append(f"<td>{row['date_of_service']}</td>")
+            table_rows.append(f"<td>{row['provider_name']}</td>")
+            table_rows.append(f"<td>{row['insurance_company']}</td>")
+            table_rows.append(f"<td>${row['charges_amount']:,.2f}</td>")
+            table_rows.append(f"<td>${row['benefit_amount']:,.2f}</td>")
+            table_rows.append(f"<td>${row['total_transaction_value']:,.2f}</td>")
             
 
             claim_status = row['claim_status']
@@ -147,7 +278,7 @@ class ReconciliationEngine:
                 status_class = 'status-overpaid'
             elif claim_status == 'Pending':
                 status_class = 'status-underpaid'
-            table_rows += f'<td><span class="status-badge {status_class}">{claim_status}</span></td>'
+            table_rows.append(f'<td><span class="status-badge {status_class}">{claim_status}</span></td>')
             
             status = row['reconciliation_status']
             badge_class = ''
@@ -158,9 +289,10 @@ class ReconciliationEngine:
             elif status == 'UNDERPAID':
                 badge_class = 'status-underpaid'
             
-            table_rows += f'<td><span class="status-badge {badge_class}">{status}</span></td>'
-            table_rows += f"<td>${row['variance']:,.2f}</td>"
-            table_rows += "</tr>"
+            table_rows.append(f'<td><span class="status-badge {badge_class}">{status}</span></td>')
+            table_rows.append(f"<td>${row['variance']:,.2f}</td>")
+            table_rows.append("</tr>")
+        table_rows = "".join(table_rows)
         
         table_html = f"""
         <table class="data-table">
@@ -580,7 +712,29 @@ class ReconciliationEngine:
         
         return stats
     
-    def run(self, output_path='report.html'):
+    def export(self, output_path, fmt='csv'):
+
+        output_file = Path(output_path)
+
+        if fmt == 'csv':
+            self.reconciliation_df.write_csv(output_file)
+        elif fmt == 'parquet':
+            self.reconciliation_df.write_parquet(output_file)
+        elif fmt == 'json':
+            self.reconciliation_df.write_json(output_file)
+        elif fmt == 'html':
+            self.generate_html_report(output_file)
+        else:
+            raise ValueError(f"Unsupported export format: {fmt}")
+
+        return output_file
+    
+    def run(self, output_path='report.html', profile_dir=None):
+
+        if profile_dir is not None:
+            from profiling import profile_run
+            stats, self.profile_run_dir = profile_run(self, output_path, profile_dir)
+            return stats
 
         self.load_data()
         self.process_reconciliation()
@@ -590,14 +744,15 @@ class ReconciliationEngine:
         
         return stats
 
-def main():
+def main(claims_path='data/claims.csv', invoices_path='data/invoices.csv',
+         output_path='report.html'):
  
     engine = ReconciliationEngine(
-        claims_path='data/claims.csv',
-        invoices_path='data/invoices.csv'
+        claims_path=claims_path,
+        invoices_path=invoices_path
     )
     
-    engine.run(output_path='report.html')
+    engine.run(output_path=output_path)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,184 @@
+
+import math
+from statistics import NormalDist
+
+import polars as pl
+
+# Estimators for approximate statistics. The sample is a set of whole claims
+# (picked by hashing claim_id, so each claim comes with all of its invoices)
+# and the size of every group in the full claims table is known exactly, so
+# each group is estimated as its own stratum with a finite population
+# correction.
+#
+# A group with fewer than 2 sampled claims (and not fully sampled) has no
+# variance estimate. It is marked unknown: its standard error is infinite,
+# and a group that wasn't sampled at all borrows the overall sample mean for
+# its point estimate instead of counting as 0.
+
+
+def z_score(confidence):
+
+    if not 0 < confidence < 1:
+        raise ValueError(f"confidence must be between 0 and 1, got {confidence}")
+    return NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+def group_estimates(sample, population_counts, by, value):
+
+    # population_counts has one row per group: `by` and 'population'
+    overall_mean = sample.select(value.mean()).item()
+
+    return population_counts.join(
+        sample.group_by(by).agg([
+            pl.len().alias('sampled'),
+            value.mean().alias('mean'),
+            value.var().alias('var')
+        ]),
+        on=by,
+        how='left'
+    ).with_columns(
+        pl.col('sampled').fill_null(0)
+    ).with_columns(
+        (
+            (pl.col('sampled') >= 2) | (pl.col('sampled') == pl.col('population'))
+        ).alias('known')
+    ).with_columns([
+        pl.col('mean').fill_null(overall_mean),
+        pl.when(pl.col('sampled') == pl.col('population')).then(0.0)
+        .when(pl.col('known')).then(
+            (
+                (1 - pl.col('sampled') / pl.col('population'))
+                * pl.col('var') / pl.col('sampled')
+            ).clip(lower_bound=0).sqrt()
+        )
+        .otherwise(float('inf'))
+        .alias('mean_se')
+    ]).with_columns([
+        (pl.col('population') * pl.col('mean')).alias('total'),
+        (pl.col('population') * pl.col('mean_se')).alias('total_se')
+    ])
+
+
+def stratified_total(sample, strata_counts, by, value):
+
+    estimates = group_estimates(sample, strata_counts, by, value)
+    total = estimates['total'].sum()
+    se = math.sqrt((estimates['total_se'] ** 2).sum())
+    return total, se
+
+
+def interval(estimate, se, z, lower=-math.inf, upper=math.inf):
+
+    return (max(lower, estimate - z * se), min(upper, estimate + z * se))
+
+
+def wilson_interval(p, n, z):
+
+    # Wilson score interval for a proportion; unlike p +/- z*se it stays wide
+    # when an outcome is rare or wasn't sampled at all
+    if n <= 0:
+        return (0.0, 1.0)
+    denominator = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return (max(0.0, centre - half_width), min(1.0, centre + half_width))
+
+
+def strata_ready(sample, population_counts, by):
+
+    # every stratum has a variance estimate (or is small enough to be complete)
+    return group_estimates(sample, population_counts, by, pl.lit(0.0))['known'].all()
+
+
+def estimate_statistics(sample, population, confidence=0.95):
+
+    # population: 'total_claims', plus per-group counts for 'insurance_company',
+    # 'provider_name' and 'claim_status' as DataFrames with a 'population' column
+    z = z_score(confidence)
+    total_claims = population['total_claims']
+    strata = population['insurance_company']
+    intervals = {}
+    stats = {'total_claims': total_claims}
+
+    for status in ['BALANCED', 'OVERPAID', 'UNDERPAID']:
+        indicator = (pl.col('reconciliation_status') == status).cast(pl.Float64)
+        count, se = stratified_total(sample, strata, 'insurance_company', indicator)
+        count = min(max(count, 0), total_claims)
+        key = status.lower()
+        stats[key] = round(count)
+        stats[f'{key}_pct'] = (count / total_claims * 100) if total_claims > 0 else 0
+
+        if len(sample) >= total_claims:
+            intervals[key] = (count, count)
+        elif math.isinf(se):
+            intervals[key] = (0, total_claims)
+        else:
+            # Wilson on the effective sample size of the stratified estimate;
+            # with no variance (outcome never or always seen) use the raw size
+            p = count / total_claims
+            p_se = se / total_claims
+            n_eff = p * (1 - p) / (p_se * p_se) if p_se > 0 else len(sample)
+            low, high = wilson_interval(p, n_eff, z)
+            intervals[key] = (low * total_claims, high * total_claims)
+        intervals[f'{key}_pct'] = tuple(
+            (bound / total_claims * 100) if total_claims > 0 else 0
+            for bound in intervals[key]
+        )
+
+    overpaid_amount = pl.when(
+        pl.col('reconciliation_status') == 'OVERPAID'
+    ).then(pl.col('variance')).otherwise(0.0)
+    underpaid_amount = pl.when(
+        pl.col('reconciliation_status') == 'UNDERPAID'
+    ).then(-pl.col('variance')).otherwise(0.0)
+
+    for key, value in [('total_overpaid_amount', overpaid_amount),
+                       ('total_underpaid_amount', underpaid_amount)]:
+        amount, se = stratified_total(sample, strata, 'insurance_company', value)
+        stats[key] = amount
+        intervals[key] = interval(amount, se, z, lower=0)
+
+    # claim_status comes straight from the claims table, so it's exact
+    stats['claim_status_counts'] = {
+        row['claim_status']: row['population']
+        for row in population['claim_status'].to_dicts()
+    }
+
+    # providers without a variance estimate can't be ranked yet
+    provider_stats = group_estimates(
+        sample, population['provider_name'], 'provider_name', pl.col('variance')
+    )
+    ranked = provider_stats.filter(pl.col('known'))
+    stats['top_providers'] = [{
+        'provider_name': row['provider_name'],
+        'count': row['population'],
+        'total_variance': row['total'],
+        'total_variance_ci': interval(row['total'], row['total_se'], z)
+    } for row in ranked.sort('total', descending=True).head(5).to_dicts()]
+    stats['top_providers_note'] = (
+        f"ranked among the {len(ranked)} of {len(provider_stats)} providers "
+        f"with at least 2 sampled claims"
+    )
+
+    insurance_stats = group_estimates(
+        sample, strata, 'insurance_company', pl.col('variance')
+    ).sort('total', descending=True)
+    stats['insurance_stats'] = [{
+        'insurance_company': row['insurance_company'],
+        'count': row['population'],
+        'total_variance': row['total'],
+        'total_variance_ci': interval(row['total'], row['total_se'], z),
+        'avg_variance': row['mean'],
+        'avg_variance_ci': interval(row['mean'], row['mean_se'], z)
+    } for row in insurance_stats.to_dicts()]
+
+    stats['approximate'] = True
+    stats['confidence'] = confidence
+    stats['sampled_claims'] = len(sample)
+    stats['sample_fraction'] = len(sample) / total_claims if total_claims > 0 else 0
+    stats['unknown_strata'] = insurance_stats.filter(
+        ~pl.col('known')
+    )['insurance_company'].to_list()
+    stats['confidence_intervals'] = intervals
+
+    return stats